@@ -2,6 +2,8 @@ from __future__ import print_function, division
 
 import os, os.path, re
 import logging
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from six import string_types
 try:
     import cPickle as pickle
@@ -15,8 +17,12 @@ try:
     import pandas as pd
     import matplotlib.pyplot as plt
     from matplotlib import cm
+    _JET = cm.jet
+    from scipy.special import logsumexp
 except ImportError:
     ConfigObj, np, plt, cm = (None, None, None, None)
+    _JET = None
+    logsumexp = None
 
 
 from .populations import PopulationSet, DEFAULT_MODELS, ArtificialPopulation
@@ -87,6 +93,8 @@ class FPPCalculation(object):
         for pop in self.popset.poplist:
             pop.lhoodcachefile = lhoodcachefile
 
+        self._lhood_arrays = {}
+
     @classmethod
     def from_ini(cls, folder, ini_file='fpp.ini', ichrone='mist', recalc=False,
                 refit_trap=False, **kwargs):
@@ -339,6 +347,133 @@ class FPPCalculation(object):
         if attr != 'popset':
             return getattr(self.popset, attr)
 
+    def clear_cache(self):
+        """
+        Clears memoized likelihoods.
+
+        Called by all the methods below that change the populations.
+        Memoized values are keyed on the state of the populations
+        and signal anyway, so this just drops ones that are stale.
+        """
+        self._lhood_arrays.clear()
+
+    def change_prior(self, **kwargs):
+        """
+        Changes prior factor(s) in all populations
+
+        See :func:`PopulationSet.change_prior`.
+        """
+        self.popset.change_prior(**kwargs)
+        self.clear_cache()
+
+    def set_maxrad(self, newrad):
+        """
+        Sets max allowed radius in populations
+
+        See :func:`PopulationSet.set_maxrad`.
+        """
+        self.popset.set_maxrad(newrad)
+        self.clear_cache()
+
+    def apply_secthresh(self, secthresh, **kwargs):
+        """
+        Applies secondary depth constraint to each population
+
+        See :func:`PopulationSet.apply_secthresh`.
+        """
+        self.popset.apply_secthresh(secthresh, **kwargs)
+        self.clear_cache()
+
+    def constrain_oddeven(self, diff, **kwargs):
+        """
+        Constrains the difference b/w primary and secondary to be < diff
+
+        See :func:`PopulationSet.constrain_oddeven`.
+        """
+        self.popset.constrain_oddeven(diff, **kwargs)
+        self.clear_cache()
+
+    def apply_trend_constraint(self, limit, dt, **kwargs):
+        """
+        Applies RV trend non-detection constraint to each population
+
+        See :func:`PopulationSet.apply_trend_constraint`.
+        """
+        self.popset.apply_trend_constraint(limit, dt, **kwargs)
+        self.clear_cache()
+
+    def apply_multicolor_transit(self, band, depth):
+        """
+        Applies multicolor transit constraint to each population
+
+        See :func:`PopulationSet.apply_multicolor_transit`.
+        """
+        self.popset.apply_multicolor_transit(band, depth)
+        self.clear_cache()
+
+    def apply_cc(self, cc, **kwargs):
+        """
+        Applies contrast curve constraint to each population
+
+        See :func:`PopulationSet.apply_cc`.
+        """
+        self.popset.apply_cc(cc, **kwargs)
+        self.clear_cache()
+
+    def apply_vcc(self, vcc):
+        """
+        Applies velocity contrast curve constraint to each population
+
+        See :func:`PopulationSet.apply_vcc`.
+        """
+        self.popset.apply_vcc(vcc)
+        self.clear_cache()
+
+    def constrain_property(self, prop, **kwargs):
+        """
+        Constrains property for each population
+
+        See :func:`PopulationSet.constrain_property`.
+        """
+        self.popset.constrain_property(prop, **kwargs)
+        self.clear_cache()
+
+    def replace_constraint(self, name, **kwargs):
+        """
+        Replaces removed constraint in each population
+
+        See :func:`PopulationSet.replace_constraint`.
+        """
+        self.popset.replace_constraint(name, **kwargs)
+        self.clear_cache()
+
+    def remove_constraint(self, *names):
+        """
+        Removes constraint from each population
+
+        See :func:`PopulationSet.remove_constraint`.
+        """
+        self.popset.remove_constraint(*names)
+        self.clear_cache()
+
+    def add_population(self, pop):
+        """
+        Adds population to PopulationSet
+
+        See :func:`PopulationSet.add_population`.
+        """
+        self.popset.add_population(pop)
+        self.clear_cache()
+
+    def remove_population(self, pop):
+        """
+        Removes population from PopulationSet
+
+        See :func:`PopulationSet.remove_population`.
+        """
+        self.popset.remove_population(pop)
+        self.clear_cache()
+
     def save(self, overwrite=True):
         """
         Saves PopulationSet and TransitSignal.
@@ -458,17 +593,12 @@ class FPPCalculation(object):
         header += 'fpV fp FPP'
         if to_file:
             fout.write('{} \n'.format(header))
-        Ls = {}
-        Ltot = 0
-        lhoods = {}
-        for model in self.popset.modelnames:
-            lhoods[model] = self.lhood(model)
-            Ls[model] = self.prior(model)*lhoods[model]
-            Ltot += Ls[model]
-
-        line = ''
-        for model in self.popset.modelnames:
-            line += '%.2e %.2e %.2e ' % (lhoods[model], Ls[model], Ls[model]/Ltot)
+        _, priors, lhoods = self._prior_lhood_arrays()
+        Ls = priors * lhoods
+        Ltot = float(np.dot(priors, lhoods))
+
+        line = ''.join(['%.2e %.2e %.2e ' % (lhood, L, L/Ltot)
+                        for lhood, L in zip(lhoods, Ls)])
         line += '%.3g %.3f %.2e' % (self.fpV(),self.priorfactors['fp_specific'],self.FPP())
 
         if to_file:
@@ -518,162 +648,204 @@ class FPPCalculation(object):
         :param figformat: (optional)
             Desired format of saved figure.
 
+        :param simple: (optional)
+            If ``True``, then only the final probability pie chart
+            and FPP are drawn.
+
         """
-        if simple:
-            starinfo = False
-            siginfo = False
-            priorinfo = False
-            constraintinfo = False
-
-        setfig(fig,figsize=figsize)
-        # three pie charts
-        priors = []; lhoods = []; Ls = []
-        for model in self.popset.modelnames:
-            priors.append(self.prior(model))
-            lhoods.append(self.lhood(model))
-            if np.isnan(priors[-1]):
-                raise ValueError('{} prior is nan; priorfactors={}'.format(model,
-                                                                           self.priorfactors))
-            Ls.append(priors[-1]*lhoods[-1])
-        priors = np.array(priors)
-        lhoods = np.array(lhoods)
-
-        Ls = np.array(Ls)
+        names, priors, lhoods = self._prior_lhood_arrays()
+        bad = np.isnan(priors)
+        if bad.any():
+            raise ValueError('{} prior is nan; priorfactors={}'.format(names[bad][0],
+                                                                       self.priorfactors))
+        Ls = priors * lhoods
+        Ltot = float(np.dot(priors, lhoods))
+        Ls_n = Ls / Ltot
         logging.debug('modelnames={}'.format(self.popset.modelnames))
         logging.debug('priors={}'.format(priors))
         logging.debug('lhoods={}'.format(lhoods))
 
         #colors = ['b','g','r','m','c']
         nmodels = len(self.popset.modelnames)
-        colors = [cm.jet(1.*i/nmodels) for i in range(nmodels)]
+        colors = _JET(np.linspace(0., 1., nmodels, endpoint=False))
         legendprop = {'size':8}
 
-        ax1 = plt.axes([0.15,0.45,0.35,0.43])
-        try:
-            plt.pie(priors/priors.sum(),colors=colors)
-            labels = []
-            for i,model in enumerate(self.popset.modelnames):
-                labels.append('%s: %.1e' % (model,priors[i]))
-            plt.legend(labels,bbox_to_anchor=(-0.25,-0.1),loc='lower left',prop=legendprop)
-            plt.title('Priors')
-        except:
-            msg = 'Error calculating priors.\n'
-            for i,mod in enumerate(self.popset.shortmodelnames):
-                msg += '%s: %.1e' % (model,priors[i])
-            plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
+        L_labels = ['%s: %.3f' % (m,L) for m,L in zip(names,Ls_n)]
 
+        if not simple:
+            priors_n = priors / priors.sum()
+            lhoods_n = lhoods / lhoods.sum()
+            prior_labels = ['%s: %.1e' % (m,p) for m,p in zip(names,priors)]
+            lhood_labels = ['%s: %.1e' % (m,l) for m,l in zip(names,lhoods)]
 
-        ax2 = plt.axes([0.5,0.45,0.35,0.43])
-        try:
-            plt.pie(lhoods/lhoods.sum(),colors=colors)
-            labels = []
-            for i,model in enumerate(self.popset.modelnames):
-                labels.append('%s: %.1e' % (model,lhoods[i]))
-            plt.legend(labels,bbox_to_anchor=(1.25,-0.1),loc='lower right',prop=legendprop)
-            plt.title('Likelihoods')
-        except:
-            msg = 'Error calculating lhoods.\n'
-            for i,mod in enumerate(self.popset.shortmodelnames):
-                msg += '%s: %.1e' % (model,lhoods[i])
-            plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
+            parts = []
+            if self.popset.constraints:
+                heb_cs = self['heb'].constraints
+                beb_cs = self['beb'].constraints
+                parts = ['%s' % (heb_cs[c] if c in heb_cs else
+                                 beb_cs[c] if c in beb_cs else
+                                 self['heb_px2'].constraints[c])
+                         for c in self.popset.constraints]
+            constraints = '\n  '.join(['Constraints:'] + parts)
 
-        ax3 = plt.axes([0.3,0.03,0.4,0.5])
-        try:
-            plt.pie(Ls/Ls.sum(),colors=colors)
-            labels = []
-            #for i,model in enumerate(['eb','heb','bgeb','bgpl','pl']):
-            for i,model in enumerate(self.popset.modelnames):
-                labels.append('%s: %.3f' % (model,Ls[i]/Ls.sum()))
-            plt.legend(labels,bbox_to_anchor=(1.6,0.44),loc='right',prop={'size':10},shadow=True)
-            plt.annotate('Final Probability',xy=(0.5,-0.01),ha='center',xycoords='axes fraction',fontsize=18)
-        except:
-            msg = 'Error calculating final probabilities.\n'
-            plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
+        fppinfo = self._fpp_annotation((names, priors, lhoods))
 
+        # Nothing is shown when saving, so don't redraw as we go.
+        interactive = plt.isinteractive()
+        if saveplot:
+            plt.ioff()
+        try:
+            setfig(fig,figsize=figsize)
+            fig = plt.gcf()
 
-        """
-        #starpars = 'Star parameters used\nin simulations'
-        starpars = ''
-        if 'M' in self['heb'].stars.keywords and 'DM_P' in self.keywords:
-            starpars += '\n$M/M_\odot = %.2f^{+%.2f}_{-%.2f}$' % (self['M'],self['DM_P'],self['DM_N'])
-        else:
-            starpars += '\n$(M/M_\odot = %.2f \pm %.2f)$' % (self['M'],0)  #this might not always be right?
+            if simple:
+                # final probability pie chart only
+                plt.axes([0.1,0.1,0.6,0.75])
+                try:
+                    plt.pie(Ls_n,colors=colors)
+                    plt.legend(L_labels,bbox_to_anchor=(1.5,0.5),loc='right',prop={'size':10},shadow=True)
+                    plt.annotate('Final Probability',xy=(0.5,-0.01),ha='center',xycoords='axes fraction',fontsize=18)
+                except:
+                    msg = 'Error calculating final probabilities.\n'
+                    plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
+            else:
+                # three pie charts
+                ax1 = plt.axes([0.15,0.45,0.35,0.43])
+                try:
+                    plt.pie(priors_n,colors=colors)
+                    plt.legend(prior_labels,bbox_to_anchor=(-0.25,-0.1),loc='lower left',prop=legendprop)
+                    plt.title('Priors')
+                except:
+                    msg = 'Error calculating priors.\n'
+                    for i,mod in enumerate(self.popset.shortmodelnames):
+                        msg += '%s: %.1e' % (mod,priors[i])
+                    plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
 
-        if 'DR_P' in self.keywords:
-            starpars += '\n$R/R_\odot = %.2f^{+%.2f}_{-%.2f}$' % (self['R'],self['DR_P'],self['DR_N'])
-        else:
-            starpars += '\n$R/R_\odot = %.2f \pm %.2f$' % (self['R'],self['DR'])
 
-        if 'FEH' in self.keywords:
-            if 'DFEH_P' in self.keywords:
-                starpars += '\n$[Fe/H] = %.2f^{+%.2f}_{-%.2f}$' % (self['FEH'],self['DFEH_P'],self['DFEH_N'])
-            else:
-                starpars += '\n$[Fe/H] = %.2f \pm %.2f$' % (self['FEH'],self['DFEH'])
-        for kw in self.keywords:
-            if re.search('-',kw):
+                ax2 = plt.axes([0.5,0.45,0.35,0.43])
                 try:
-                    starpars += '\n$%s = %.2f (%.2f)$ ' % (kw,self[kw],self['COLORTOL'])
-                except TypeError:
-                    starpars += '\n$%s = %s (%.2f)$ ' % (kw,self[kw],self['COLORTOL'])
-
-        #if 'J-K' in self.keywords:
-        #    starpars += '\n$J-K = %.2f (%.2f)$ ' % (self['J-K'],self['COLORTOL'])
-        #if 'G-R' in self.keywords:
-        #    starpars += '\n$g-r = %.2f (%.2f)$' % (self['G-R'],self['COLORTOL'])
-        if starinfo:
-            plt.annotate(starpars,xy=(0.03,0.91),xycoords='figure fraction',va='top')
-
-        #p.annotate('Star',xy=(0.04,0.92),xycoords='figure fraction',va='top')
-
-        priorpars = r'$f_{b,short} = %.2f$  $f_{trip} = %.2f$' % (self.priorfactors['fB']*self.priorfactors['f_Pshort'],
-                                                                self.priorfactors['ftrip'])
-        if 'ALPHA' in self.priorfactors:
-            priorpars += '\n'+r'$f_{pl,bg} = %.2f$  $\alpha_{pl,bg} = %.1f$' % (self.priorfactors['fp'],self['ALPHA'])
-        else:
-            priorpars += '\n'+r'$f_{pl,bg} = %.2f$  $\alpha_1,\alpha_2,r_b = %.1f,%.1f,%.1f$' % \
-                         (self.priorfactors['fp'],self['bgpl'].stars.keywords['ALPHA1'],
-                          self['bgpl'].stars.keywords['ALPHA2'],
-                          self['bgpl'].stars.keywords['RBREAK'])
-
-        rbin1,rbin2 = self['RBINCEN']-self['RBINWID'],self['RBINCEN']+self['RBINWID']
-        priorpars += '\n$f_{pl,specific} = %.2f, \in [%.2f,%.2f] R_\oplus$' % (self.priorfactors['fp_specific'],rbin1,rbin2)
-        priorpars += '\n$r_{confusion} = %.1f$"' % sqrt(self.priorfactors['area']/pi)
-        if self.priorfactors['multboost'] != 1:
-            priorpars += '\nmultiplicity boost = %ix' % self.priorfactors['multboost']
-        if priorinfo:
-            plt.annotate(priorpars,xy=(0.03,0.4),xycoords='figure fraction',va='top')
-
-
-        sigpars = ''
-        sigpars += '\n$P = %s$ d' % self['P']
-        depth,ddepth = self.trsig.depthfit
-        sigpars += '\n$\delta = %i^{+%i}_{-%i}$ ppm' % (depth*1e6,ddepth[1]*1e6,ddepth[0]*1e6)
-        dur,ddur = self.trsig.durfit
-        sigpars += '\n$T = %.2f^{+%.2f}_{-%.2f}$ h' % (dur*24.,ddur[1]*24,ddur[0]*24)
-        slope,dslope = self.trsig.slopefit
-        sigpars += '\n'+r'$T/\tau = %.1f^{+%.1f}_{-%.1f}$' % (slope,dslope[1],dslope[0])
-        sigpars += '\n'+r'$(T/\tau)_{max} = %.1f$' % (self.trsig.maxslope)
-        if siginfo:
-            plt.annotate(sigpars,xy=(0.81,0.91),xycoords='figure fraction',va='top')
-
-            #p.annotate('${}^a$Not used for FP population simulations',xy=(0.02,0.02),
-            #           xycoords='figure fraction',fontsize=9)
-        """
-
-        constraints = 'Constraints:'
-        for c in self.popset.constraints:
-            try:
-                constraints += '\n  %s' % self['heb'].constraints[c]
-            except KeyError:
+                    plt.pie(lhoods_n,colors=colors)
+                    plt.legend(lhood_labels,bbox_to_anchor=(1.25,-0.1),loc='lower right',prop=legendprop)
+                    plt.title('Likelihoods')
+                except:
+                    msg = 'Error calculating lhoods.\n'
+                    for i,mod in enumerate(self.popset.shortmodelnames):
+                        msg += '%s: %.1e' % (mod,lhoods[i])
+                    plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
+
+                ax3 = plt.axes([0.3,0.03,0.4,0.5])
                 try:
-                    constraints += '\n  %s' % self['beb'].constraints[c]
-                except KeyError:
-                    constraints += '\n  %s' % self['heb_px2'].constraints[c]
-        if constraintinfo:
-            plt.annotate(constraints,xy=(0.03,0.22),xycoords='figure fraction',
-                         va='top',color='red')
+                    plt.pie(Ls_n,colors=colors)
+                    plt.legend(L_labels,bbox_to_anchor=(1.6,0.44),loc='right',prop={'size':10},shadow=True)
+                    plt.annotate('Final Probability',xy=(0.5,-0.01),ha='center',xycoords='axes fraction',fontsize=18)
+                except:
+                    msg = 'Error calculating final probabilities.\n'
+                    plt.annotate(msg, xy=(0.5,0.5), xycoords='axes fraction')
+
+
+                """
+                #starpars = 'Star parameters used\nin simulations'
+                starpars = ''
+                if 'M' in self['heb'].stars.keywords and 'DM_P' in self.keywords:
+                    starpars += '\n$M/M_\odot = %.2f^{+%.2f}_{-%.2f}$' % (self['M'],self['DM_P'],self['DM_N'])
+                else:
+                    starpars += '\n$(M/M_\odot = %.2f \pm %.2f)$' % (self['M'],0)  #this might not always be right?
 
-        odds = 1./self.FPP()
+                if 'DR_P' in self.keywords:
+                    starpars += '\n$R/R_\odot = %.2f^{+%.2f}_{-%.2f}$' % (self['R'],self['DR_P'],self['DR_N'])
+                else:
+                    starpars += '\n$R/R_\odot = %.2f \pm %.2f$' % (self['R'],self['DR'])
+
+                if 'FEH' in self.keywords:
+                    if 'DFEH_P' in self.keywords:
+                        starpars += '\n$[Fe/H] = %.2f^{+%.2f}_{-%.2f}$' % (self['FEH'],self['DFEH_P'],self['DFEH_N'])
+                    else:
+                        starpars += '\n$[Fe/H] = %.2f \pm %.2f$' % (self['FEH'],self['DFEH'])
+                for kw in self.keywords:
+                    if re.search('-',kw):
+                        try:
+                            starpars += '\n$%s = %.2f (%.2f)$ ' % (kw,self[kw],self['COLORTOL'])
+                        except TypeError:
+                            starpars += '\n$%s = %s (%.2f)$ ' % (kw,self[kw],self['COLORTOL'])
+
+                #if 'J-K' in self.keywords:
+                #    starpars += '\n$J-K = %.2f (%.2f)$ ' % (self['J-K'],self['COLORTOL'])
+                #if 'G-R' in self.keywords:
+                #    starpars += '\n$g-r = %.2f (%.2f)$' % (self['G-R'],self['COLORTOL'])
+                if starinfo:
+                    plt.annotate(starpars,xy=(0.03,0.91),xycoords='figure fraction',va='top')
+
+                #p.annotate('Star',xy=(0.04,0.92),xycoords='figure fraction',va='top')
+
+                priorpars = r'$f_{b,short} = %.2f$  $f_{trip} = %.2f$' % (self.priorfactors['fB']*self.priorfactors['f_Pshort'],
+                                                                        self.priorfactors['ftrip'])
+                if 'ALPHA' in self.priorfactors:
+                    priorpars += '\n'+r'$f_{pl,bg} = %.2f$  $\alpha_{pl,bg} = %.1f$' % (self.priorfactors['fp'],self['ALPHA'])
+                else:
+                    priorpars += '\n'+r'$f_{pl,bg} = %.2f$  $\alpha_1,\alpha_2,r_b = %.1f,%.1f,%.1f$' % \
+                                 (self.priorfactors['fp'],self['bgpl'].stars.keywords['ALPHA1'],
+                                  self['bgpl'].stars.keywords['ALPHA2'],
+                                  self['bgpl'].stars.keywords['RBREAK'])
+
+                rbin1,rbin2 = self['RBINCEN']-self['RBINWID'],self['RBINCEN']+self['RBINWID']
+                priorpars += '\n$f_{pl,specific} = %.2f, \in [%.2f,%.2f] R_\oplus$' % (self.priorfactors['fp_specific'],rbin1,rbin2)
+                priorpars += '\n$r_{confusion} = %.1f$"' % sqrt(self.priorfactors['area']/pi)
+                if self.priorfactors['multboost'] != 1:
+                    priorpars += '\nmultiplicity boost = %ix' % self.priorfactors['multboost']
+                if priorinfo:
+                    plt.annotate(priorpars,xy=(0.03,0.4),xycoords='figure fraction',va='top')
+
+
+                sigpars = ''
+                sigpars += '\n$P = %s$ d' % self['P']
+                depth,ddepth = self.trsig.depthfit
+                sigpars += '\n$\delta = %i^{+%i}_{-%i}$ ppm' % (depth*1e6,ddepth[1]*1e6,ddepth[0]*1e6)
+                dur,ddur = self.trsig.durfit
+                sigpars += '\n$T = %.2f^{+%.2f}_{-%.2f}$ h' % (dur*24.,ddur[1]*24,ddur[0]*24)
+                slope,dslope = self.trsig.slopefit
+                sigpars += '\n'+r'$T/\tau = %.1f^{+%.1f}_{-%.1f}$' % (slope,dslope[1],dslope[0])
+                sigpars += '\n'+r'$(T/\tau)_{max} = %.1f$' % (self.trsig.maxslope)
+                if siginfo:
+                    plt.annotate(sigpars,xy=(0.81,0.91),xycoords='figure fraction',va='top')
+
+                    #p.annotate('${}^a$Not used for FP population simulations',xy=(0.02,0.02),
+                    #           xycoords='figure fraction',fontsize=9)
+                """
+
+                if constraintinfo:
+                    plt.annotate(constraints,xy=(0.03,0.22),xycoords='figure fraction',
+                                 va='top',color='red')
+
+            plt.annotate(fppinfo,xy=(0.7,0.02),
+                         xycoords='figure fraction',fontsize=16,va='bottom')
+
+            plt.suptitle(self.trsig.name,fontsize=22)
+
+            #if not simple:
+            #    plt.annotate('n = %.0e' % self.n,xy=(0.5,0.85),xycoords='figure fraction',
+            #                 fontsize=14,ha='center')
+
+            if saveplot:
+                if tag is not None:
+                    fig.savefig('%s/FPPsummary_%s.%s' % (folder,tag,figformat))
+                else:
+                    fig.savefig('%s/FPPsummary.%s' % (folder,figformat))
+                plt.close(fig)
+        finally:
+            plt.interactive(interactive)
+
+    def _fpp_annotation(self, arrays):
+        """
+        Returns fpV/FPP text for summary plot.
+
+        Same as :func:`FPPCalculation.fpV` and :func:`FPPCalculation.FPP`
+        (with no skipped models), from the output of
+        :func:`FPPCalculation._prior_lhood_arrays` already in hand.
+        """
+        logfpp, logP = self._logFPP_logP(arrays=arrays)
+        fpV = self._fpV_from_P(np.exp(logP))
+
+        odds = np.exp(-logfpp)
 
         if odds > 1e6:
             fppstr = 'FPP: < 1 in 1e6'
@@ -682,57 +854,104 @@ class FPPCalculation(object):
         else:
             fppstr = 'FPP calculation failed.'
 
-        plt.annotate('$f_{pl,V} = %.3f$\n%s' % (self.fpV(),fppstr),xy=(0.7,0.02),
-                     xycoords='figure fraction',fontsize=16,va='bottom')
-
-        plt.suptitle(self.trsig.name,fontsize=22)
-
-        #if not simple:
-        #    plt.annotate('n = %.0e' % self.n,xy=(0.5,0.85),xycoords='figure fraction',
-        #                 fontsize=14,ha='center')
-
-        if saveplot:
-            if tag is not None:
-                plt.savefig('%s/FPPsummary_%s.%s' % (folder,tag,figformat))
-            else:
-                plt.savefig('%s/FPPsummary.%s' % (folder,figformat))
-            plt.close()
-
+        return '$f_{pl,V} = %.3f$\n%s' % (fpV,fppstr)
 
     def lhoodplots(self,folder='.',tag=None,figformat='png',
-                   recalc_lhood=False, **kwargs):
+                   recalc_lhood=False, threads=1, **kwargs):
         """
         Make a plot of the likelihood for each model in PopulationSet
 
-        """
-        Ltot = 0
+        :param threads: (optional)
+            Number of processes over which to spread the plots.
+            Each worker gets a copy of this object once (for free,
+            under ``fork``) and renders with the ``agg`` backend.
 
-        for model in self.popset.modelnames:
-            Ltot += self.prior(model)*self.lhood(model, recalc=recalc_lhood)
+        :param **kwargs:
+            Additional keyword arguments passed to
+            :func:`FPPCalculation.lhoodplot`.
+        """
+        _, priors, lhoods = self._prior_lhood_arrays(recalc=recalc_lhood)
+        kwargs['Ltot'] = float(np.dot(priors, lhoods))
 
+        jobs = []
         for model in self.popset.shortmodelnames:
             if isinstance(self[model], ArtificialPopulation):
                 continue
-            self.lhoodplot(model,Ltot=Ltot,**kwargs)
             if tag is None:
-                plt.savefig('%s/%s.%s' % (folder,model,figformat))
+                filename = '%s/%s.%s' % (folder,model,figformat)
             else:
-                plt.savefig('%s/%s_%s.%s' % (folder,model,figformat))
-            plt.close()
+                filename = '%s/%s_%s.%s' % (folder,model,tag,figformat)
+            jobs.append((model, filename))
+
+        if threads > 1 and len(jobs) > 1:
+            pool = Pool(min(threads, len(jobs)),
+                        initializer=_init_lhoodplot_worker,
+                        initargs=(self, kwargs))
+            try:
+                pool.map(_lhoodplot_worker, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for model, filename in jobs:
+                self._save_lhoodplot(model, filename, **kwargs)
+
+    def _save_lhoodplot(self, model, filename, **kwargs):
+        fig = self.lhoodplot(model, **kwargs)
+        fig.savefig(filename)
+        plt.close(fig)
 
     def lhoodplot(self,model,suptitle='',**kwargs):
         """
         Make a plot of the likelihood for a given model.
+
+        :returns:
+            The :class:`matplotlib.figure.Figure`.
         """
         if suptitle=='':
             suptitle = self[model].model
         self[model].lhoodplot(self.trsig,colordict=self.popset.colordict,
                               suptitle=suptitle,**kwargs)
+        return plt.gcf()
 
-    def calc_lhoods(self,**kwargs):
+    def calc_lhoods(self, threads=1, **kwargs):
+        """
+        Calculates the likelihood of each population.
+
+        Results are memoized as in :func:`FPPCalculation._prior_lhood_arrays`.
+
+        :param threads: (optional)
+            Number of threads to spread the populations over.
+            Each thread uses the serial likelihood kernel, which
+            releases the GIL, so populations are evaluated at the
+            same time (numba's parallel kernels may not be launched
+            from several threads at once).  By default, populations
+            are evaluated one at a time with
+            :func:`PopulationSet.lhoods`, each spread over all of
+            numba's threads.
+
+        :param **kwargs:
+            Additional keyword arguments passed to ``lhood``
+            of each population.
+        """
         logging.debug('Calculating likelihoods...')
-        for pop in self.popset.poplist:
-            L = pop.lhood(self.trsig,**kwargs)
+        poplist = self.popset.poplist
+
+        def lhood(pop):
+            return pop.lhood(self.trsig,parallel=False,**kwargs)
+
+        if threads > 1:
+            pool = ThreadPool(min(threads, len(poplist)))
+            try:
+                Ls = np.array(pool.map(lhood, poplist))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            Ls = self.popset.lhoods(self.trsig,**kwargs)
+        self._lhood_arrays[hash(self)] = Ls
+
+        for pop,L in zip(poplist, Ls):
             logging.debug('%s: %.2e' % (pop.model,L))
 
     def __hash__(self):
@@ -744,61 +963,144 @@ class FPPCalculation(object):
     def prior(self,model):
         """
         Return the prior for a given model.
+
+        As in :func:`FPPCalculation._prior_lhood_arrays`, priors
+        are not memoized, since they depend on ``priorfactors``.
         """
         return self[model].prior
 
     def lhood(self,model,**kwargs):
         """
         Return the likelihood for a given model.
+
+        Taken from the memoized values of
+        :func:`FPPCalculation._prior_lhood_arrays` if they are
+        current; otherwise (or if keyword arguments such as
+        ``recalc`` are passed) ``lhood`` of just this population
+        is called.
         """
-        return self[model].lhood(self.trsig,
-                                 **kwargs)
+        pop = self[model]
+        if kwargs or not self._lhood_arrays:
+            return pop.lhood(self.trsig, **kwargs)
+        lhoods = self._lhood_arrays.get(hash(self))
+        if lhoods is None:
+            return pop.lhood(self.trsig)
+        return lhoods[self.popset.modelnames.index(pop.model)]
+
+    def _lhoods(self, recalc=False):
+        """
+        Returns likelihoods of all models, memoized on ``hash(self)``.
 
-    def Pval(self,skipmodels=None):
-        Lfpp = 0
-        if skipmodels is None:
-            skipmodels = []
+        :param recalc: (optional)
+            Passed to :func:`PopulationSet.lhoods`; also bypasses
+            the memoized values.
+        """
+        key = hash(self)
+        if recalc or key not in self._lhood_arrays:
+            self._lhood_arrays[key] = self.popset.lhoods(self.trsig, recalc=recalc)
+        return self._lhood_arrays[key]
+
+    def _prior_lhood_arrays(self, recalc=False):
+        """
+        Returns names, priors, and likelihoods of all models as arrays.
+
+        Likelihoods are memoized on the state of ``self.popset`` and
+        ``self.trsig`` (via :func:`FPPCalculation.__hash__`), so calling
+        e.g. :func:`FPP` right after :func:`Pval` doesn't evaluate
+        (or re-read from the cache file) every ``lhood`` again.
+        Priors are cheap, and depend on ``priorfactors`` (which
+        are not part of the hash), so they are always recomputed.
+
+        :param recalc: (optional)
+            Passed to :func:`FPPCalculation._lhoods`.
+
+        :returns:
+            ``(names, priors, lhoods)``, as ``np.ndarray``.
+        """
+        pops = self.popset.poplist
+        names = np.array([pop.model for pop in pops])
+
+        lhoods = self._lhoods(recalc=recalc)
+        priors = np.fromiter((pop.prior for pop in pops),
+                             dtype=float, count=len(pops))
+
+        for name, prior, lhood in zip(names, priors, lhoods):
+            logging.debug('%s: %.2e = %.2e (prior) x %.2e (lhood)' % (name,prior*lhood,prior,lhood))
+        return names, priors, lhoods
+
+    def _logL_pl_fpp(self, skipmodels=None, arrays=None, shortnames=True):
+        """
+        Returns log of planet and summed false positive prior x likelihood.
+
+        Working with logs keeps very small priors/likelihoods from
+        underflowing or losing precision in the sum.
+
+        :param skipmodels: (optional)
+            False positive models to leave out of the sum.
+
+        :param shortnames: (optional)
+            Whether ``skipmodels`` may also give short model names
+            (as for :func:`FPPCalculation.FPP`), or only long ones
+            (as for :func:`FPPCalculation.Pval`).
+
+        :param arrays: (optional)
+            Output of :func:`FPPCalculation._prior_lhood_arrays`,
+            if already in hand.
+        """
+        skipset = frozenset(skipmodels or ())
         logging.debug('evaluating likelihoods for %s' % self.trsig.name)
 
-        for model in self.popset.modelnames:
-            if model=='Planets':
-                continue
-            if model not in skipmodels:
-                prior = self.prior(model)
-                lhood = self.lhood(model)
-                Lfpp += prior*lhood
-                logging.debug('%s: %.2e = %.2e (prior) x %.2e (lhood)' % (model,prior*lhood,prior,lhood))
-        prior = self.prior('pl')
-        lhood = self.lhood('pl')
-        Lpl = prior*lhood
-        logging.debug('planet: %.2e = %.2e (prior) x %.2e (lhood)' % (prior*lhood,prior,lhood))
-        return Lpl/Lfpp/self['pl'].priorfactors['fp_specific']
+        if arrays is None:
+            arrays = self._prior_lhood_arrays()
+        names, priors, lhoods = arrays
+        fp = ~np.isin(names, list(skipset | {'Planets'}))
+        if shortnames:
+            fp &= ~np.isin(np.array(self.popset.shortmodelnames),
+                           list(skipset | {'pl'}))
+        ipl = names.tolist().index('Planets')
+
+        with np.errstate(divide='ignore'):
+            logLs = np.log(priors) + np.log(lhoods)
+        return logLs[ipl], logsumexp(logLs[fp])
+
+    def _logFPP_logP(self, skipmodels=None, arrays=None, shortnames=True):
+        """
+        Returns logs of :func:`FPPCalculation.FPP` and :func:`FPPCalculation.Pval`.
+
+        Arguments as for :func:`FPPCalculation._logL_pl_fpp`.
+        """
+        logLpl, logLfpp = self._logL_pl_fpp(skipmodels, arrays=arrays,
+                                            shortnames=shortnames)
+        # Lfpp/(Lpl + Lfpp), rather than 1 - Lpl/(Lpl + Lfpp),
+        #  so that small FPPs don't lose precision.
+        logfpp = logLfpp - np.logaddexp(logLpl, logLfpp)
+        with np.errstate(divide='ignore'):
+            logP = (logLpl - logLfpp -
+                    np.log(self['pl'].priorfactors['fp_specific']))
+        return logfpp, logP
+
+    @staticmethod
+    def _fpV_from_P(P, FPPV=0.005):
+        return (1-FPPV)/(P*FPPV)
+
+    def Pval(self,skipmodels=None):
+        """
+        Return planet/false positive likelihood ratio
+
+        Unlike :func:`FPPCalculation.FPP`, ``skipmodels`` here
+        only matches long model names (e.g. ``'BEBs'``).
+        """
+        return np.exp(self._logFPP_logP(skipmodels, shortnames=False)[1])
 
     def fpV(self,FPPV=0.005,skipmodels=None):
         P = self.Pval(skipmodels=skipmodels)
-        return (1-FPPV)/(P*FPPV)
+        return self._fpV_from_P(P, FPPV)
 
     def FPP(self,skipmodels=None):
         """
         Return the false positive probability (FPP)
         """
-        Lfpp = 0
-        if skipmodels is None:
-            skipmodels = []
-        logging.debug('evaluating likelihoods for %s' % self.trsig.name)
-        for shortmodel, model in zip(self.popset.shortmodelnames, self.popset.modelnames):
-            if model=='Planets':
-                continue
-            if (model not in skipmodels) and (shortmodel not in skipmodels):
-                prior = self.prior(model)
-                lhood = self.lhood(model)
-                Lfpp += prior*lhood
-                logging.debug('%s: %.2e = %.2e (prior) x %.2e (lhood)' % (model,prior*lhood,prior,lhood))
-        prior = self.prior('pl')
-        lhood = self.lhood('pl')
-        Lpl = prior*lhood
-        logging.debug('planet: %.2e = %.2e (prior) x %.2e (lhood)' % (prior*lhood,prior,lhood))
-        return 1 - Lpl/(Lpl + Lfpp)
+        return np.exp(self._logFPP_logP(skipmodels)[0])
 
     def bootstrap_FPP(self, N=10, filename='results_bootstrap.txt'):
         lines = []
@@ -811,3 +1113,17 @@ class FPPCalculation(object):
             for l in lines:
                 fout.write(l + '\n')
         return h, lines
+
+
+# State for :func:`FPPCalculation.lhoodplots` worker processes
+_LHOODPLOT_ARGS = None
+
+def _init_lhoodplot_worker(fpp, kwargs):
+    global _LHOODPLOT_ARGS
+    plt.switch_backend('agg')
+    _LHOODPLOT_ARGS = (fpp, kwargs)
+
+def _lhoodplot_worker(job):
+    fpp, kwargs = _LHOODPLOT_ARGS
+    model, filename = job
+    fpp._save_lhoodplot(model, filename, **kwargs)
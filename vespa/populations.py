@@ -5,6 +5,7 @@ import os, os.path
 import re
 import math
 import copy
+import threading
 
 on_rtd = os.environ.get('READTHEDOCS') == 'True'
 
@@ -41,9 +42,10 @@ from .transit_basic import eclipse_pars
 from .transit_basic import eclipse, eclipse_tt, NoEclipseError, NoFitError
 from .transit_basic import MAXSLOPE
 from .fitebs import fitebs
+from .statutils import kde_lhood
 
 from .plotutils import setfig, plot2dhist
-from .hashutils import hashcombine
+from .hashutils import hashcombine, hashdict
 
 from .stars.populations import StarPopulation, MultipleStarPopulation
 from .stars.populations import BGStarPopulation, BGStarPopulation_TRILEGAL
@@ -84,6 +86,14 @@ SHORT_MODELNAMES = {'Planets':'pl',
 
 INV_SHORT_MODELNAMES = {v:k for k,v in SHORT_MODELNAMES.items()}
 
+# Serializes appends to likelihood cache files, e.g. when
+#  :func:`FPPCalculation.calc_lhoods` runs with threads > 1.
+_LHOODCACHE_LOCK = threading.Lock()
+
+# Parsed likelihood cache files: {path: (cache, bytes read, first bytes)}.
+#  See :func:`_loadcache`.
+_LHOODCACHES = {}
+
 DEFAULT_MODELS = ['beb','heb','eb',
                   'beb_Px2', 'heb_Px2','eb_Px2',
                   'pl']
@@ -585,11 +595,11 @@ class EclipsePopulation(StarPopulation):
         else:
             return self.kde(np.array([logd, dur, slope]))
 
-    def lhood(self, trsig, recalc=False, cachefile=None):
+    def lhood(self, trsig, recalc=False, cachefile=None, parallel=True):
         """Returns likelihood of transit signal
 
-        Returns sum of ``trsig`` MCMC samples evaluated
-        at ``self.kde``.
+        Returns mean of ``self.kde`` evaluated at the ``trsig``
+        MCMC samples (see :func:`statutils.kde_lhood`).
 
         :param trsig:
             :class:`vespa.TransitSignal` object.
@@ -601,6 +611,10 @@ class EclipsePopulation(StarPopulation):
         :param cachefile: (optional)
             File that holds likelihood calculation cache.
 
+        :param parallel: (optional)
+            Passed to :func:`statutils.kde_lhood`; set to ``False``
+            when calling from multiple threads.
+
         """
         if not hasattr(self,'kde'):
             self._make_kde()
@@ -618,11 +632,12 @@ class EclipsePopulation(StarPopulation):
         if self.is_ruled_out:
             return 0
 
-        N = trsig.kde.dataset.shape[1]
-        lh = self.kde(trsig.kde.dataset).sum() / N
+        lh = kde_lhood(self.kde, (trsig.durs, trsig.logdeps, trsig.slopes),
+                       parallel=parallel)
 
-        with open(cachefile, 'a') as fout:
-            fout.write('%i %g\n' % (key, lh))
+        with _LHOODCACHE_LOCK:
+            with open(cachefile, 'a') as fout:
+                fout.write('%i %g\n' % (key, lh))
 
         return lh
 
@@ -2286,6 +2301,22 @@ class PopulationSet(object):
             key = hashcombine(key,pop)
         return key
 
+    def lhoods(self, trsig, recalc=False, cachefile=None):
+        """
+        Likelihoods of transit signal for all populations
+
+        :param trsig:
+            :class:`vespa.TransitSignal` object.
+
+        :param recalc, cachefile: (optional)
+            As for :func:`EclipsePopulation.lhood`.
+
+        :returns:
+            Array of likelihoods, in the order of ``self.poplist``.
+        """
+        return np.array([pop.lhood(trsig, recalc=recalc, cachefile=cachefile)
+                         for pop in self.poplist])
+
     def __getitem__(self,name):
         name = name.lower()
         if name in ['pl','pls']:
@@ -2892,6 +2923,9 @@ class ArtificialPopulation(EclipsePopulation):
     def resample(self):
         return copy.deepcopy(self)
 
+    def __hash__(self):
+        return hashcombine(self.model, hashdict(self.__dict__))
+
 class BoxyModel(ArtificialPopulation):
     max_slope = MAXSLOPE
     logd_range = (-5,0)
@@ -2952,17 +2986,39 @@ def fressin_occurrence(rp):
 
 def _loadcache(cachefile):
     """ Returns a dictionary resulting from reading a likelihood cachefile
+
+    Cache files are only ever appended to, so parsed caches are kept
+    in memory (in ``_LHOODCACHES``) along with how far into the file
+    they have been read; each call then only parses lines added since
+    the last one, rather than re-reading the whole file.  If the file
+    got shorter, or its first bytes changed, it is read from the start.
     """
-    cache = {}
-    if os.path.exists(cachefile):
-        with open(cachefile) as f:
-            for line in f:
-                line = line.split()
-                if len(line) == 2:
-                    try:
-                        cache[int(line[0])] = float(line[1])
-                    except:
-                        pass
+    path = os.path.abspath(cachefile)
+    with _LHOODCACHE_LOCK:
+        cache, pos, head = _LHOODCACHES.get(path, ({}, 0, b''))
+        if not os.path.exists(path):
+            _LHOODCACHES.pop(path, None)
+            return {}
+        with open(path, 'rb') as f:
+            first = f.read(64)
+            if (not first.startswith(head) or
+                    os.fstat(f.fileno()).st_size < pos):
+                # File was truncated or replaced; start over.
+                cache, pos = {}, 0
+            head = first
+            f.seek(pos)
+            data = f.read()
+        # Leave any partially-written last line for next time.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode().splitlines():
+            line = line.split()
+            if len(line) == 2:
+                try:
+                    cache[int(line[0])] = float(line[1])
+                except:
+                    pass
+        pos += end
+        _LHOODCACHES[path] = (cache, pos, head)
     return cache
 
 
@@ -1,10 +1,25 @@
 from __future__ import division, print_function
 
+import os
+import math
+
+on_rtd = os.environ.get('READTHEDOCS') == 'True'
+
 try:
     import numpy as np
 except ImportError:
     np = None
-    
+
+if not on_rtd:
+    from numba import jit, prange
+else:
+    prange = range
+    # make fake decorators to allow RTD docs to build without numba
+    def jit(*args, **kwargs):
+        def foo(*args, **kwargs):
+            pass
+        return foo
+
 def kdeconf(kde,conf=0.683,xmin=None,xmax=None,npts=500,
             shortest=True,conftol=0.001,return_max=False):
     """
@@ -96,3 +111,74 @@ def conf_interval(x,L,conf=0.683,shortest=True,
         return xmaxL,lo,hi
     else:
         return (lo,hi)
+
+
+def kde_lhood(kde, points, parallel=True):
+    """
+    Mean of 3-d :class:`scipy.stats.gaussian_kde` evaluated at points
+
+    Same as ``kde(points).mean()``, but the double loop over
+    KDE data and ``points`` is done by a compiled kernel, without
+    building the full ``(n, N)`` distance matrix.
+
+    :param kde:
+        Unweighted :class:`scipy.stats.gaussian_kde` in 3 dimensions.
+
+    :param points:
+        Array of shape ``(3, N)``, or sequence of three
+        length-``N`` columns.
+
+    :param parallel: (optional)
+        Whether to spread ``points`` over numba's threads.
+        Pass ``False`` when calling from several Python threads
+        at once: numba's default ``workqueue`` threading layer
+        aborts the process on concurrent parallel launches.
+        The serial kernel releases the GIL, so such calls still
+        run at the same time.
+
+    Each coordinate is handed to the kernel as its own contiguous
+    ``float64`` column, so the inner loop only does unit-stride reads.
+    """
+    x0, x1, x2 = [np.ascontiguousarray(x, dtype=float) for x in kde.dataset]
+    y0, y1, y2 = [np.ascontiguousarray(y, dtype=float) for y in points]
+    norm = np.sqrt(np.linalg.det(2*np.pi*kde.covariance))
+    if parallel:
+        kernel = _kde_lhood_kernel
+    else:
+        kernel = _kde_lhood_kernel_serial
+    return kernel(x0, x1, x2, y0, y1, y2, kde.inv_cov, norm)
+
+def _kde_lhood_sum(x0, x1, x2, y0, y1, y2, icov, norm):
+    """
+    Mean over points ``y`` of Gaussian KDE on data ``x``
+
+    Coordinates are passed as separate contiguous arrays.
+    Compiled below both with ``parallel=True`` and as a serial,
+    ``nogil=True`` kernel for threads (``prange`` is plain ``range``
+    in the latter).
+    """
+    n = len(x0)
+    N = len(y0)
+    a00 = icov[0,0]
+    a11 = icov[1,1]
+    a22 = icov[2,2]
+    a01 = 2*icov[0,1]
+    a02 = 2*icov[0,2]
+    a12 = 2*icov[1,2]
+    tot = 0.
+    for j in prange(N):
+        s = 0.
+        for i in range(n):
+            d0 = y0[j] - x0[i]
+            d1 = y1[j] - x1[i]
+            d2 = y2[j] - x2[i]
+            q = (a00*d0*d0 + a11*d1*d1 + a22*d2*d2 +
+                 a01*d0*d1 + a02*d0*d2 + a12*d1*d2)
+            s += math.exp(-0.5*q)
+        tot += s
+    return tot / (n * N * norm)
+
+_kde_lhood_kernel = jit(nopython=True, parallel=True,
+                        fastmath=True)(_kde_lhood_sum)
+_kde_lhood_kernel_serial = jit(nopython=True, nogil=True,
+                               fastmath=True)(_kde_lhood_sum)
@@ -4,7 +4,11 @@ import os, os.path
 import unittest
 import tempfile
 
+from numpy.testing import assert_allclose
+
 from vespa.fpp import FPPCalculation
+from vespa.populations import BoxyModel, ArtificialPopulation, _loadcache
+from vespa.hashutils import hashcombine
 
 import pkg_resources
 
@@ -32,6 +36,73 @@ class TestFPP(unittest.TestCase):
         fpp = self.f.FPP()
         assert fpp > 0
 
+    def test_skipmodels(self):
+        assert self.f.FPP(skipmodels=['beb']) <= self.f.FPP()
+        assert self.f.fpV(skipmodels=['beb']) <= self.f.fpV()
+
+    def test_fpp_annotation(self):
+        text = self.f._fpp_annotation(self.f._prior_lhood_arrays())
+        assert '$f_{pl,V} = %.3f$' % self.f.fpV() in text
+
+    def test_calc_lhoods_threads(self):
+        self.f.calc_lhoods(threads=2)
+        assert hash(self.f) in self.f._lhood_arrays
+        assert self.f.FPP() > 0
+
+    def test_constraint_after_fpp(self):
+        fpp = self.f.FPP()
+        self.f['eb'].constrain_property('depth', lo=1.)
+        names, _, lhoods = self.f._prior_lhood_arrays()
+        assert lhoods[list(names).index('EBs')] == 0
+        assert self.f.FPP() != fpp
+
+    def test_prior_lhood_memo(self):
+        pr = self.f.prior('pl')
+        fp_specific = self.f['pl'].priorfactors['fp_specific']
+        self.f.change_prior(fp_specific=0.5*fp_specific)
+        assert_allclose(self.f.prior('pl'), 0.5*pr)
+        self.f['pl'].priorfactors['fp_specific'] = fp_specific
+        assert_allclose(self.f.prior('pl'), pr)
+
+        self.f.lhood('heb')
+        self.f.apply_secthresh(1e-6)
+        # cache file only holds 6 significant figures
+        assert_allclose(self.f.lhood('heb'),
+                        self.f['heb'].lhood(self.f.trsig), rtol=1e-5)
+        names, priors, lhoods = self.f._prior_lhood_arrays()
+        i = list(names).index('HEBs')
+        assert self.f.lhood('heb') == lhoods[i]
+        assert self.f.prior('heb') == priors[i]
+
+    def test_popset_lhoods(self):
+        popset, trsig = self.f.popset, self.f.trsig
+        popset.add_population(BoxyModel(1e-4, 2.))
+        popset['eb'].constrain_property('depth', lo=1.)
+        assert popset['eb'].is_ruled_out
+
+        folder = tempfile.mkdtemp()
+        cachefile = os.path.join(folder, 'lhoodcache.dat')
+        popset['heb'].lhood(trsig, cachefile=cachefile)
+        Ls = popset.lhoods(trsig, cachefile=cachefile)
+
+        other = os.path.join(folder, 'other.dat')
+        expected = [pop.lhood(trsig, recalc=True, cachefile=other)
+                    for pop in popset.poplist]
+        # cache file only holds 6 significant figures
+        assert_allclose(Ls, expected, rtol=1e-5)
+
+        cache = _loadcache(cachefile)
+        for pop in popset.poplist:
+            if isinstance(pop, ArtificialPopulation) or pop.is_ruled_out:
+                continue
+            assert hashcombine(pop, trsig) in cache
+
+    def test_pval_skipmodels(self):
+        # Pval only matches long model names; FPP takes short ones too
+        assert self.f.Pval(skipmodels=['beb']) == self.f.Pval()
+        assert self.f.Pval(skipmodels=['BEBs']) >= self.f.Pval()
+        assert self.f.FPP(skipmodels=['beb']) == self.f.FPP(skipmodels=['BEBs'])
+
     def test_bootstrap(self):
         h, lines = self.f.bootstrap_FPP(N=3)
         for line in lines:
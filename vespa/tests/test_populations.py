@@ -15,6 +15,7 @@ from vespa.populations import HEBPopulation
 from vespa.populations import EBPopulation
 from vespa.populations import BEBPopulation
 from vespa.populations import PlanetPopulation
+from vespa.populations import _loadcache
 
 from isochrones.starmodel import StarModel
 from isochrones.starmodel import BinaryStarModel
@@ -115,3 +116,45 @@ class TestPlanetPopulation(TestPopulation):
         del kwargs['mags']
         kwargs['rprs'] = self.rprs
         return kwargs
+
+class TestLoadCache(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), 'lhoodcache.dat')
+
+    def write(self, text, mode='a'):
+        with open(self.filename, mode) as fout:
+            fout.write(text)
+
+    def test_append(self):
+        self.write('1 0.5\n2 0.25\n')
+        assert _loadcache(self.filename) == {1: 0.5, 2: 0.25}
+        self.write('3 0.125\n')
+        assert _loadcache(self.filename) == {1: 0.5, 2: 0.25, 3: 0.125}
+
+    def test_partial_line(self):
+        self.write('1 0.5\n2 0.2')
+        assert _loadcache(self.filename) == {1: 0.5}
+        self.write('5\n')
+        assert _loadcache(self.filename) == {1: 0.5, 2: 0.25}
+
+    def test_rewritten(self):
+        self.write('1 0.5\n2 0.25\n')
+        _loadcache(self.filename)
+        self.write('3 0.125\n', mode='w')
+        assert _loadcache(self.filename) == {3: 0.125}
+
+    def test_truncated(self):
+        lines = ['%i 0.5\n' % (10**18 + i) for i in range(10)]
+        self.write(''.join(lines))
+        assert len(_loadcache(self.filename)) == 10
+        # keeps the first 64 bytes, so only the length gives it away
+        self.write(''.join(lines[:4]), mode='w')
+        assert _loadcache(self.filename) == {10**18 + i: 0.5 for i in range(4)}
+
+    def test_deleted(self):
+        self.write('1 0.5\n')
+        _loadcache(self.filename)
+        os.remove(self.filename)
+        assert _loadcache(self.filename) == {}
+        self.write('2 0.25\n')
+        assert _loadcache(self.filename) == {2: 0.25}
@@ -0,0 +1,56 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+from numpy.testing import assert_allclose
+import numpy as np
+from scipy.stats import gaussian_kde
+
+from vespa.statutils import kde_lhood
+
+def test_kde_lhood():
+    rng = np.random.RandomState(42)
+    data = rng.normal(size=(3, 500)) * [[0.1], [0.3], [2.]]
+    kde = gaussian_kde(data)
+    pts = rng.normal(size=(3, 200)) * [[0.05], [0.1], [1.]]
+    assert_allclose(kde_lhood(kde, pts), kde(pts).mean(), rtol=1e-10)
+
+def test_kde_lhood_columns():
+    rng = np.random.RandomState(42)
+    data = rng.normal(size=(3, 500))
+    kde = gaussian_kde(data)
+    pts = rng.normal(size=(200, 3))
+    assert_allclose(kde_lhood(kde, list(pts.T)), kde_lhood(kde, pts.T))
+
+def test_kde_lhood_serial():
+    rng = np.random.RandomState(42)
+    kde = gaussian_kde(rng.normal(size=(3, 500)))
+    pts = rng.normal(size=(3, 200))
+    assert_allclose(kde_lhood(kde, pts, parallel=False),
+                    kde_lhood(kde, pts), rtol=1e-10)
+
+def test_kde_lhood_threads():
+    rng = np.random.RandomState(42)
+    kdes = [gaussian_kde(rng.normal(size=(3, 300))) for i in range(6)]
+    pts = rng.normal(size=(3, 200))
+    pool = ThreadPool(3)
+    try:
+        Ls = pool.map(lambda kde: kde_lhood(kde, pts, parallel=False), kdes)
+    finally:
+        pool.close()
+        pool.join()
+    assert_allclose(Ls, [kde_lhood(kde, pts) for kde in kdes], rtol=1e-10)
+
+def test_kde_lhood_serial_releases_gil():
+    rng = np.random.RandomState(42)
+    kde = gaussian_kde(rng.normal(size=(3, 20000)))
+    pts = rng.normal(size=(3, 3000))
+    kde_lhood(kde, pts[:, :10], parallel=False)  # compile first
+    worker = threading.Thread(target=kde_lhood, args=(kde, pts),
+                              kwargs={'parallel': False})
+    worker.start()
+    for i in range(10**6):
+        pass
+    # This thread only gets this far before the kernel is done
+    #  if the kernel let go of the GIL.
+    assert worker.is_alive()
+    worker.join()